@@ -0,0 +1,92 @@
+from bisect import bisect_left
+from collections import namedtuple
+from threading import Lock
+
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredients
+from .cache import get_table_version
+from .serializers import IngredientsSerializer
+
+
+Snapshot = namedtuple('Snapshot', ('version', 'keys', 'items', 'content'))
+
+
+def normalize(value):
+    return value.strip().lower().replace('ё', 'е')
+
+
+class IngredientsIndex:
+    """
+    Индекс ингредиентов в памяти воркера.
+    Хранит отсортированные нормализованные названия и уже
+    сериализованный JSON каждого ингредиента. Перестраивается,
+    когда в общем кеше меняется версия таблицы, и читает строки
+    из первичной базы, чтобы не сохранить под новой версией данные
+    отстающей реплики. Весь индекс публикуется одним снимком, чтобы
+    потоки воркера не видели новые названия рядом со старым JSON.
+    """
+
+    def __init__(self):
+        self.snapshot = Snapshot(None, [], [], b'[]')
+        self.lock = Lock()
+
+    def build(self, version):
+        renderer = JSONRenderer()
+        rows = sorted(
+            (
+                normalize(ingredient.name),
+                ingredient.name,
+                renderer.render(IngredientsSerializer(ingredient).data),
+            )
+            for ingredient in Ingredients.objects.using(DEFAULT_DB_ALIAS)
+        )
+        items = [item for _, _, item in rows]
+        return Snapshot(
+            version,
+            [key for key, _, _ in rows],
+            items,
+            b'[' + b','.join(items) + b']'
+        )
+
+    def refresh(self):
+        version = get_table_version(Ingredients)
+        if self.snapshot.version != version:
+            with self.lock:
+                if self.snapshot.version != version:
+                    self.snapshot = self.build(version)
+        return self.snapshot
+
+    def all(self):
+        return self.refresh().content
+
+    def search(self, value, limit):
+        """
+        JSON-массив ингредиентов: сначала совпадения с начала названия,
+        затем вхождения. None, если ничего не найдено.
+        """
+
+        snapshot = self.refresh()
+        value = normalize(value)
+        keys, items = snapshot.keys, snapshot.items
+        found = []
+        index = bisect_left(keys, value)
+        while (
+            index < len(keys)
+            and len(found) < limit
+            and keys[index].startswith(value)
+        ):
+            found.append(items[index])
+            index += 1
+        for index, key in enumerate(keys):
+            if len(found) >= limit:
+                break
+            if value in key and not key.startswith(value):
+                found.append(items[index])
+        if not found:
+            return None
+        return b'[' + b','.join(found) + b']'
+
+
+ingredients_index = IngredientsIndex()
@@ -0,0 +1,42 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def table_version_key(model):
+    return f'{model._meta.label_lower}:version'
+
+
+def get_table_version(model):
+    """Текущая версия таблицы; меняется при любом изменении её строк."""
+
+    key = table_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        return cache.get(key)
+    return version
+
+
+def bump_table_version(model):
+    cache.set(table_version_key(model), uuid4().hex, timeout=None)
+
+
+def versioned_key(model, *parts):
+    """Ключ кеша, который устаревает вместе с версией таблицы."""
+
+    return ':'.join(
+        (model._meta.label_lower, get_table_version(model), *map(str, parts))
+    )
+
+
+def recipe_fragment_key(recipe_id):
+    return f'recipes.recipes:{recipe_id}:fragment'
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    """Удаляет закешированные части рецептов после коммита транзакции."""
+
+    keys = [recipe_fragment_key(recipe_id) for recipe_id in recipe_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import Exists, Func, IntegerField, OuterRef, Subquery
+
+from recipes.models import Recipes
+from users.models import Follow
+
+
+class Unnest(Func):
+    function = 'unnest'
+    output_field = IntegerField()
+
+
+def get_feed_page(user, queryset, ordering, condition, limit):
+    """
+    Страница ленты рецептов авторов, на которых подписан user.
+    При небольшом числе подписок у каждого автора берётся не больше
+    limit рецептов по индексу (author, pub_date), и эти списки
+    сливаются в одну страницу. При большом числе подписок выгоднее
+    идти по общему индексу даты и отбрасывать чужих авторов.
+    """
+
+    follows = Follow.objects.filter(user=user)
+    fanout_limit = settings.FEED_FANOUT_LIMIT
+    if follows[:fanout_limit + 1].count() > fanout_limit:
+        queryset = queryset.filter(
+            Exists(follows.filter(author_id=OuterRef('author_id')))
+        )
+    else:
+        latest = ArraySubquery(
+            Recipes.objects
+            .filter(condition, author_id=OuterRef('author_id'))
+            .order_by(*ordering)
+            .values('id')[:limit]
+        )
+        queryset = queryset.filter(id__in=Subquery(
+            follows.annotate(recipe_id=Unnest(latest)).values('recipe_id')
+        ))
+    return queryset.filter(condition).order_by(*ordering)[:limit]
@@ -0,0 +1,58 @@
+import binascii
+from tempfile import SpooledTemporaryFile
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import ImageField
+
+BASE64_MARKER = ';base64,'
+# Кратно 4, чтобы каждый кусок декодировался независимо.
+BASE64_CHUNK_SIZE = 64 * 1024 * 4
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Картинка рецепта: файл из multipart-запроса или строка base64.
+    base64 декодируется по частям во временный файл, без второй
+    копии всей картинки в памяти.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return ImageField.to_internal_value(self, data)
+        if not isinstance(data, str) or data in self.EMPTY_VALUES:
+            return super().to_internal_value(data)
+        return ImageField.to_internal_value(self, self.decode(data))
+
+    def decode(self, data):
+        start = data.find(BASE64_MARKER)
+        start = 0 if start == -1 else start + len(BASE64_MARKER)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                file.write(binascii.a2b_base64(
+                    data[offset:offset + BASE64_CHUNK_SIZE]
+                ))
+            size = file.tell()
+            file.seek(0)
+            with Image.open(file) as image:
+                extension = (image.format or '').lower()
+        except (binascii.Error, ValueError, OSError):
+            file.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        if extension not in self.ALLOWED_TYPES:
+            file.close()
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        file.seek(0)
+        return UploadedFile(
+            file,
+            name=f'{uuid4()}.{extension}',
+            content_type=Image.MIME.get(extension.upper()),
+            size=size
+        )
@@ -1,11 +1,40 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity
+)
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Value,
+    When
+)
+from django.db.models.functions import Cast, Lower
 from django_filters.rest_framework import FilterSet, filters
 
 from recipes.models import Ingredients, Recipes, Tags
+from recipes.search import SEARCH_CONFIG
 
-FILTER_DATA = {
-    'favorites': 'favorites__user',
-    'shop_card': 'shopping_cart__user'
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+    'trending': ('-trending_score', '-pub_date', '-id'),
 }
+RECIPE_SEARCH_ORDERING = ('-search_rank', '-pub_date', '-id')
+RECIPE_ORDERING_CHOICES = (
+    ('popular', 'Больше всего в избранном'),
+    ('trending', 'Популярные за последнее время'),
+)
+
+TAGS_MATCH_ANY = 'any'
+TAGS_MATCH_ALL = 'all'
+TAGS_MATCH_CHOICES = (
+    (TAGS_MATCH_ANY, 'Хотя бы один из тегов'),
+    (TAGS_MATCH_ALL, 'Все теги'),
+)
 
 
 class RecipeFilter(FilterSet):
@@ -15,6 +44,16 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tags.objects.all(),
+        method='filter_tags',
+    )
+    tags_match = filters.ChoiceFilter(
+        choices=TAGS_MATCH_CHOICES,
+        method='filter_tags_match',
+    )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=RECIPE_ORDERING_CHOICES,
+        method='filter_ordering',
     )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
@@ -25,28 +64,97 @@ class RecipeFilter(FilterSet):
         model = Recipes
         fields = (
             'tags',
+            'tags_match',
             'author',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
+            'ordering',
+        )
+
+    def filter_tags(self, queryset, name, value):
+        # Подзапросы EXISTS вместо JOIN: рецепт не дублируется
+        # и не нужен DISTINCT.
+        if not value:
+            return queryset
+        recipe_tags = Recipes.tags.through.objects.filter(
+            recipes_id=OuterRef('pk')
+        )
+        tags_ids = {tag.id for tag in value}
+        if self.form.cleaned_data.get('tags_match') == TAGS_MATCH_ALL:
+            for tag_id in tags_ids:
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tags_id=tag_id))
+                )
+            return queryset
+        return queryset.filter(
+            Exists(recipe_tags.filter(tags_id__in=tags_ids))
         )
 
-    def _get_queryset(self, queryset, name, value, data):
+    def filter_tags_match(self, queryset, name, value):
+        # Учитывается в filter_tags.
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        # Поиск по GIN-индексу search_vector; явный ordering
+        # применяется позже и перекрывает сортировку по релевантности.
+        value = value.strip()
+        if not value:
+            return queryset
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        # ts_rank возвращает real; double precision нужен, чтобы
+        # значение из курсора точно совпадало при сравнении.
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), query), FloatField()
+            )
+        ).order_by(*RECIPE_SEARCH_ORDERING)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
+    def _get_queryset(self, queryset, name, value):
+        # Флаги уже посчитаны аннотациями в RecipesViewSet.get_queryset.
         if value:
-            return queryset.filter(**{FILTER_DATA[data]: self.request.user})
+            return queryset.filter(**{name: True})
         return queryset
 
     def filter_is_favorited(self, queryset, name, value):
-        return self._get_queryset(queryset, name, value, 'favorites')
+        return self._get_queryset(queryset, name, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        return self._get_queryset(queryset, name, value, 'shop_card')
+        return self._get_queryset(queryset, name, value)
 
 
 class IngredientFilter(FilterSet):
-    """Поиск по названию ингредиента."""
+    """
+    Автодополнение по названию ингредиента.
+    Сначала идут совпадения с начала названия, затем вхождения,
+    затем похожие по триграммам.
+    """
 
-    name = filters.CharFilter(lookup_expr='startswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredients
         fields = ('name',)
+
+    def filter_name(self, queryset, name, value):
+        value = value.strip().lower()
+        if not value:
+            return queryset
+        # Сравнение идёт с lower(name): по нему построены индексы.
+        return queryset.alias(name_lower=Lower('name')).filter(
+            Q(name_lower__startswith=value)
+            | Q(name_lower__contains=value)
+            | Q(name_lower__trigram_similar=value)
+        ).annotate(
+            rank=Case(
+                When(name_lower__startswith=value, then=Value(0)),
+                When(name_lower__contains=value, then=Value(1)),
+                default=Value(2),
+            ),
+            similarity=TrigramSimilarity('name_lower', value),
+        ).order_by('rank', '-similarity', 'name')
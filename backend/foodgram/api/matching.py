@@ -0,0 +1,184 @@
+from array import array
+from collections import Counter, defaultdict, namedtuple
+from threading import Lock
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from recipes.models import IngredientsRecipe
+
+CHANGES_KEY = 'recipes.ingredientsrecipe:changes'
+# Если воркер отстал сильнее, индекс строится заново целиком.
+CHANGES_LIMIT = 500
+CHANGES_TIMEOUT = 60 * 60 * 24
+
+Snapshot = namedtuple(
+    'Snapshot', ('version', 'token', 'recipes', 'ingredients')
+)
+
+
+def change_key(version):
+    return f'{CHANGES_KEY}:{version}'
+
+
+def record_ingredients_change(recipe_ids):
+    """
+    После коммита записывает в общий кеш, у каких рецептов
+    поменялись ингредиенты: воркеры перечитают только их.
+    """
+
+    recipe_ids = list(recipe_ids)
+
+    def record():
+        cache.add(CHANGES_KEY, 0, timeout=None)
+        version = cache.incr(CHANGES_KEY)
+        cache.set(
+            change_key(version), (uuid4().hex, recipe_ids), CHANGES_TIMEOUT
+        )
+
+    transaction.on_commit(record)
+
+
+class RecipeIngredientsIndex:
+    """
+    Обратный индекс «ингредиент → рецепты» в памяти воркера.
+    Строки читаются из первичной базы: реплика может ещё не иметь
+    только что записанного изменения, а индекс живёт без срока.
+    Для каждого ингредиента хранится массив id рецептов, для каждого
+    рецепта — его ингредиенты. Изменения читаются из журнала в общем
+    кеше и применяются только к изменившимся рецептам. Весь индекс
+    публикуется одним снимком, поэтому потоки воркера не видят
+    его наполовину обновлённым.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.lock = Lock()
+
+    def build(self, version, token):
+        recipes = {}
+        ingredients = defaultdict(list)
+        rows = (
+            IngredientsRecipe.objects
+            .using(DEFAULT_DB_ALIAS)
+            .order_by('ingredient_id', 'recipe_id')
+            .values_list('ingredient_id', 'recipe_id')
+            .iterator(chunk_size=10000)
+        )
+        for ingredient_id, recipe_id in rows:
+            if ingredient_id not in recipes:
+                recipes[ingredient_id] = array('I')
+            recipes[ingredient_id].append(recipe_id)
+            ingredients[recipe_id].append(ingredient_id)
+        return Snapshot(version, token, recipes, {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in ingredients.items()
+        })
+
+    @staticmethod
+    def apply(snapshot, version, token, recipe_ids):
+        """Новый снимок, в котором заново прочитаны recipe_ids."""
+
+        recipes = dict(snapshot.recipes)
+        ingredients = dict(snapshot.ingredients)
+        touched = set()
+        for recipe_id in recipe_ids:
+            touched.update(ingredients.pop(recipe_id, ()))
+        added = defaultdict(list)
+        rows = IngredientsRecipe.objects.using(DEFAULT_DB_ALIAS).filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows:
+            added[ingredient_id].append(recipe_id)
+            ingredients.setdefault(recipe_id, ())
+            ingredients[recipe_id] += (ingredient_id,)
+        touched.update(added)
+        for ingredient_id in touched:
+            ids = array('I', (
+                recipe_id for recipe_id in recipes.get(ingredient_id, ())
+                if recipe_id not in recipe_ids
+            ))
+            ids.extend(added.get(ingredient_id, ()))
+            if ids:
+                recipes[ingredient_id] = ids
+            else:
+                recipes.pop(ingredient_id, None)
+        return Snapshot(version, token, recipes, ingredients)
+
+    def changes(self, snapshot, version):
+        """
+        id рецептов, изменённых после снимка, или None, если журнал
+        неполон: отстали слишком сильно, записи вытеснены из кеша
+        или счётчик начался заново.
+        """
+
+        if version < snapshot.version or (
+            version - snapshot.version > CHANGES_LIMIT
+        ):
+            return None
+        keys = [
+            change_key(number)
+            for number in range(snapshot.version, version + 1)
+        ]
+        entries = cache.get_many(keys)
+        anchor = entries.get(keys[0])
+        if (anchor[0] if anchor else None) != snapshot.token:
+            return None
+        recipe_ids = set()
+        for key in keys[1:]:
+            if key not in entries:
+                return None
+            recipe_ids.update(entries[key][1])
+        return recipe_ids, entries[keys[-1]][0]
+
+    def refresh(self):
+        version = cache.get(CHANGES_KEY, 0)
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+            changes = snapshot and self.changes(snapshot, version)
+            if changes:
+                recipe_ids, token = changes
+                snapshot = self.apply(snapshot, version, token, recipe_ids)
+            else:
+                entry = cache.get(change_key(version))
+                snapshot = self.build(version, entry[0] if entry else None)
+            self.snapshot = snapshot
+        return snapshot
+
+    def match(self, ingredient_ids):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов, в виде
+        (id, найдено, не хватает). Сначала рецепты с наибольшей долей
+        найденных ингредиентов, затем с наименьшим числом недостающих.
+        """
+
+        snapshot = self.refresh()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(snapshot.recipes.get(ingredient_id, ()))
+        # Порядок зависит только от пары (найдено, не хватает), поэтому
+        # рецепты раскладываются по корзинам, и сортируются только
+        # ключи корзин и целые id внутри них.
+        buckets = defaultdict(list)
+        for recipe_id, count in matched.items():
+            size = len(snapshot.ingredients[recipe_id])
+            buckets[count, size - count].append(recipe_id)
+        found = []
+        for count, missing in sorted(
+            buckets, key=lambda key: (-key[0] / sum(key), key[1])
+        ):
+            recipe_ids = buckets[count, missing]
+            recipe_ids.sort(reverse=True)
+            found.extend(
+                (recipe_id, count, missing) for recipe_id in recipe_ids
+            )
+        return found
+
+
+recipe_ingredients_index = RecipeIngredientsIndex()
@@ -0,0 +1,62 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .cache import versioned_key
+
+
+class ReferenceCacheMixin:
+    """
+    Кеширование справочников.
+    Готовый JSON хранится в общем кеше, ETag строится по версии
+    таблицы и адресу запроса, на If-None-Match отдаётся 304.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, self.get_list_response, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def get_list_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_etag(self, request):
+        key = versioned_key(self.queryset.model, request.get_full_path())
+        return quote_etag(md5(key.encode()).hexdigest())
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            key = f'reference:{etag}'
+            content = cache.get(key)
+            if content is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                if isinstance(response, Response):
+                    content = JSONRenderer().render(response.data)
+                else:
+                    content = response.content
+                cache.set(key, content, settings.REFERENCE_CACHE_TIMEOUT)
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.REFERENCE_CACHE_MAX_AGE
+        )
+        return response
@@ -0,0 +1,263 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+INVALID_CURSOR_MESSAGE = 'Неверный курсор.'
+
+
+class EstimatedPage(Page):
+    """Страница, у которой наличие следующей известно без COUNT(*)."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, который не считает COUNT(*) по большим выборкам.
+    Если планировщик Postgres оценивает выборку выше порога,
+    отдаётся оценка, небольшие выборки считаются точно.
+    Результат кешируется на короткое время.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        sql, params = queryset.query.sql_with_params()
+        key = 'count:' + md5(f'{sql}:{params!r}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is not None:
+            return count
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            count = self.estimate_count(queryset, connection)
+        if (
+            count is None
+            or count < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+        ):
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def validate_number(self, number):
+        # Номер страницы не сверяется с count: оценка может быть
+        # занижена или устареть, пока лежит в кеше.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть числом.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        """
+        Срез страницы не ограничивается count; лишняя строка
+        показывает, есть ли следующая страница.
+        """
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет результатов.')
+        return EstimatedPage(
+            rows[:self.per_page], number, self, len(rows) > self.per_page
+        )
+
+    @staticmethod
+    def estimate_count(queryset, connection):
+        """Оценка числа строк: reltuples без фильтров, иначе EXPLAIN."""
+
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    (queryset.model._meta.db_table,)
+                )
+                row = cursor.fetchone()
+                if row is not None and row[0] >= 0:
+                    return int(row[0])
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Постраничная навигация по номеру страницы. С параметром cursor
+    включается keyset-режим: страница выбирается условием по полям
+    view.cursor_ordering (или view.get_cursor_ordering()) без COUNT(*)
+    и OFFSET.
+    """
+
+    django_paginator_class = EstimatedCountPaginator
+    cursor_query_param = 'cursor'
+    default_cursor_ordering = ('-pk',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        self.ordering = self.get_cursor_ordering(view)
+        position, reverse = self.decode_cursor(request, queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._invert(field) for field in ordering]
+        condition = Q()
+        if position is not None:
+            condition = self._after(ordering, position)
+        results = list(self.get_keyset_page(
+            queryset, view, ordering, condition, page_size + 1
+        ))
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        self.page_results = results
+        return results
+
+    def is_cursor_mode(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def get_keyset_page(self, queryset, view, ordering, condition, limit):
+        """Строки страницы; view может построить выборку по-своему."""
+
+        if hasattr(view, 'get_keyset_page'):
+            return view.get_keyset_page(queryset, ordering, condition, limit)
+        return queryset.filter(condition).order_by(*ordering)[:limit]
+
+    def get_cursor_ordering(self, view):
+        if hasattr(view, 'get_cursor_ordering'):
+            return view.get_cursor_ordering()
+        return getattr(view, 'cursor_ordering', self.default_cursor_ordering)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_results:
+            return None
+        return self.encode_cursor(self.page_results[0], reverse=True)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor['p'], bool(cursor['r'])
+            if not isinstance(position, list) or (
+                len(position) != len(self.ordering)
+            ):
+                raise ValueError
+            position = [
+                self._to_python(model, field, value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(INVALID_CURSOR_MESSAGE)
+        return position, reverse
+
+    def encode_cursor(self, obj, reverse):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            position.append(value)
+        encoded = urlsafe_b64encode(
+            json.dumps({'p': position, 'r': int(reverse)}).encode()
+        ).decode()
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def _to_python(model, field, value):
+        """
+        Значение из курсора приводится к типу поля, чтобы ошибки
+        клиента не доходили до ORM. Аннотации (search_rank) — float.
+        """
+
+        if value is None:
+            raise ValueError
+        name = field.lstrip('-')
+        try:
+            model_field = (
+                model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            )
+        except FieldDoesNotExist:
+            return float(value)
+        return model_field.clean(value, None)
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """Условие «строго после position» для заданного порядка."""
+
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+
+class FeedPagination(KeysetPagination):
+    """Лента всегда листается курсором, номера страниц не поддерживаются."""
+
+    def is_cursor_mode(self, request):
+        return True
@@ -1,13 +1,16 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import F
-from django.shortcuts import get_object_or_404
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.fields import IntegerField, SerializerMethodField
+from rest_framework.utils import html
 
-from users.models import CustomUser, Follow
+from users.models import CustomUser
 from recipes.models import (
     Favourites,
     Ingredients,
@@ -17,6 +20,36 @@ from recipes.models import (
     Tags
 )
 
+from .cache import get_table_version, recipe_fragment_key
+from .fields import RecipeImageField
+from .matching import record_ingredients_change
+from .subscriptions import get_subscription_resolver
+from .thumbnails import (RECIPE_THUMBNAIL_SIZES, SHORT_THUMBNAIL_SIZES,
+                         absolute_thumbnails, schedule_thumbnails,
+                         thumbnail_urls)
+from .utils import get_recipes_limit
+
+MULTIPART_JSON_FIELDS = ('tags', 'ingredients')
+
+RECIPES_PREFETCH = (
+    'tags',
+    Prefetch(
+        'recipe_ingredient',
+        queryset=IngredientsRecipe.objects.select_related('ingredient')
+    ),
+)
+
+
+class CustomUserListSerializer(serializers.ListSerializer):
+    """Загружает подписки на всех пользователей страницы одним запросом."""
+
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, Manager) else data)
+        get_subscription_resolver(self.context.get('request')).add(
+            user.id for user in users if not hasattr(user, 'is_subscribed')
+        )
+        return super().to_representation(users)
+
 
 class CustomUserSerializer(UserSerializer):
     """Cериализатор модели User"""
@@ -32,14 +65,14 @@ class CustomUserSerializer(UserSerializer):
                 'is_subscribed',
             )
         )
+        list_serializer_class = CustomUserListSerializer
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return Follow.objects.filter(
-            user=request.user, author=obj
-        ).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_subscription_resolver(
+            self.context.get('request')
+        ).is_subscribed(obj.id)
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
@@ -48,7 +81,8 @@ class RecipeShortSerializer(serializers.ModelSerializer):
     FavoriteSerializer, ShoppingListSerializer
     """
 
-    image = Base64ImageField()
+    image = RecipeImageField()
+    thumbnails = SerializerMethodField()
 
     class Meta:
         model = Recipes
@@ -56,9 +90,16 @@ class RecipeShortSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'thumbnails',
             'cooking_time'
         )
 
+    def get_thumbnails(self, obj):
+        return absolute_thumbnails(
+            thumbnail_urls(obj, SHORT_THUMBNAIL_SIZES),
+            self.context.get('request')
+        )
+
 
 class FollowSerializer(CustomUserSerializer):
     """Сериализатор подпищиков"""
@@ -85,11 +126,17 @@ class FollowSerializer(CustomUserSerializer):
         return data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
+        # В списке подписок рецепты уже ограничены в prefetch,
+        # срез по закешированному результату запросов не делает.
+        recipes = obj.recipes.all()
+        limit = get_recipes_limit(self.context.get('request'))
+        if limit is not None:
+            recipes = recipes[:limit]
         serializer = RecipeShortSerializer(
-            obj.recipes.all(),
+            recipes,
             many=True,
             read_only=True
         )
@@ -112,13 +159,22 @@ class IngredientsSerializer(serializers.ModelSerializer):
         model = Ingredients
 
 
+class RecipesListSerializer(serializers.ListSerializer):
+    """Сериализует страницу рецептов одним запросом к кешу."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representation_many(list(recipes))
+
+
 class RecipesGetSerializer(serializers.ModelSerializer):
     """Сериализатор для получения рецептов"""
 
     tags = TagsSerializer(many=True, read_only=True)
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField()
-    image = Base64ImageField()
+    image = RecipeImageField()
+    thumbnails = SerializerMethodField()
     author = CustomUserSerializer(read_only=True)
     ingredients = SerializerMethodField()
 
@@ -132,26 +188,103 @@ class RecipesGetSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnails',
             'text',
             'cooking_time',
         )
         model = Recipes
+        list_serializer_class = RecipesListSerializer
 
-    def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientsrecipe__amount'),
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes):
+        """
+        Общая для всех пользователей часть рецепта берётся из кеша,
+        персональные флаги подставляются при каждом ответе.
+        """
+
+        stamp = tuple(
+            get_table_version(model) for model in (Tags, Ingredients)
         )
+        cached = cache.get_many(
+            [recipe_fragment_key(recipe.id) for recipe in recipes]
+        )
+        fragments = {}
+        resolver = get_subscription_resolver(self.context.get('request'))
+        for recipe in recipes:
+            if hasattr(recipe, 'is_subscribed'):
+                recipe.author.is_subscribed = recipe.is_subscribed
+            else:
+                resolver.add((recipe.author_id,))
+            entry = cached.get(recipe_fragment_key(recipe.id))
+            if entry is not None and entry[0] == self._stamp(stamp, recipe):
+                fragments[recipe.id] = entry[1]
+        misses = [recipe for recipe in recipes if recipe.id not in fragments]
+        if misses:
+            prefetch_related_objects(misses, *RECIPES_PREFETCH)
+            for recipe in misses:
+                fragments[recipe.id] = super().to_representation(recipe)
+                fragments[recipe.id]['image'] = (
+                    recipe.image.url if recipe.image else None
+                )
+            cache.set_many(
+                {
+                    recipe_fragment_key(recipe.id): (
+                        self._stamp(stamp, recipe), fragments[recipe.id]
+                    )
+                    for recipe in misses
+                },
+                settings.RECIPE_FRAGMENT_TIMEOUT
+            )
+        return [
+            self._personalize(recipe, fragments[recipe.id])
+            for recipe in recipes
+        ]
+
+    @staticmethod
+    def _stamp(stamp, recipe):
+        # Миниатюры дописываются фоновой задачей: часть, собранная
+        # до их готовности, не должна пережить их появление.
+        return stamp + (bool(recipe.thumbnails),)
+
+    def _personalize(self, recipe, fragment):
+        data = fragment.copy()
+        data['author'] = fragment['author'].copy()
+        data['author']['is_subscribed'] = CustomUserSerializer(
+            context=self.context
+        ).get_is_subscribed(recipe.author)
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        request = self.context.get('request')
+        if data['image'] and request is not None:
+            data['image'] = request.build_absolute_uri(data['image'])
+        data['thumbnails'] = absolute_thumbnails(data['thumbnails'], request)
+        return data
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj, RECIPE_THUMBNAIL_SIZES)
+
+    def get_ingredients(self, obj):
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in obj.recipe_ingredient.all()
+        ]
 
     def get_is_favorited(self, obj):
-        return self._obj_exists(obj, Favourites)
+        return self._obj_exists(obj, Favourites, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self._obj_exists(obj, ShoppingCart)
+        return self._obj_exists(obj, ShoppingCart, 'is_in_shopping_cart')
 
-    def _obj_exists(self, recipe, name_class):
+    def _obj_exists(self, recipe, name_class, annotation):
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
@@ -176,11 +309,8 @@ class RecipesCreateSerializer(serializers.ModelSerializer):
 
     author = CustomUserSerializer(read_only=True)
     ingredients = AddIngredientInSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tags.objects.all(),
-        many=True,
-    )
-    image = Base64ImageField()
+    tags = serializers.ListField(child=IntegerField())
+    image = RecipeImageField()
 
     class Meta:
         model = Recipes
@@ -195,35 +325,50 @@ class RecipesCreateSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        # В multipart-запросе теги и ингредиенты передаются JSON-строками
+        # рядом с файлом картинки.
+        if html.is_html_input(data):
+            data = {key: data.get(key) for key in data}
+            for field in MULTIPART_JSON_FIELDS:
+                if isinstance(data.get(field), str):
+                    try:
+                        data[field] = json.loads(data[field])
+                    except ValueError:
+                        raise ValidationError({field: 'Ожидается JSON.'})
+        return super().to_internal_value(data)
+
     def validate_tags(self, value):
-        tags = value
-        if not tags:
+        if not value:
             raise ValidationError(
                 {
                     'tags': 'Добавьте тег.'
                 }
             )
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
+        tags_ids = set()
+        for tag in value:
+            if tag in tags_ids:
                 raise ValidationError(
                     {
                         'tags': f'Тег {tag} существует!'
                     }
                 )
-            tags_list.append(tag)
+            tags_ids.add(tag)
+        missing = tags_ids - Tags.objects.in_bulk(tags_ids).keys()
+        if missing:
+            raise ValidationError({
+                'tags': f'Теги {sorted(missing)} не найдены!'
+            })
         return value
 
     def validate_ingredients(self, value):
-        ingredients = value
-        if not ingredients:
+        if not value:
             raise ValidationError({
                 'ingredients': 'Нужен хотя бы один ингредиент!'
             })
-        ingredients_list = []
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredients, id=item['id'])
-            if ingredient in ingredients_list:
+        ingredients_ids = set()
+        for item in value:
+            if item['id'] in ingredients_ids:
                 raise ValidationError({
                     'ingredients': 'Ингридиенты не могут повторяться!'
                 })
@@ -231,18 +376,24 @@ class RecipesCreateSerializer(serializers.ModelSerializer):
                 raise ValidationError({
                     'amount': 'Количество ингредиента должно быть больше 0!'
                 })
-            ingredients_list.append(ingredient)
+            ingredients_ids.add(item['id'])
+        if ingredients_ids - Ingredients.objects.in_bulk(
+            ingredients_ids
+        ).keys():
+            raise NotFound('Ингредиент не найден.')
         return value
 
     @transaction.atomic
     def add_ingredients(self, ingredients, recipe):
         IngredientsRecipe.objects.bulk_create(
             [IngredientsRecipe(
-                ingredient=Ingredients.objects.get(id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
+        # bulk_create не отправляет сигналы.
+        record_ingredients_change((recipe.id,))
 
     @transaction.atomic
     def create(self, validated_data):
@@ -257,24 +408,64 @@ class RecipesCreateSerializer(serializers.ModelSerializer):
             recipe=recipe,
             ingredients=ingredients
         )
+        if recipe.image:
+            schedule_thumbnails(recipe)
         return recipe
 
+    @transaction.atomic
+    def update_ingredients(self, ingredients, recipe):
+        """Применяет к рецепту только изменившиеся ингредиенты."""
+
+        current = {
+            item.ingredient_id: item for item in recipe.recipe_ingredient.all()
+        }
+        submitted = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - submitted.keys()
+        if removed:
+            IngredientsRecipe.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id in current.keys() & submitted.keys():
+            item = current[ingredient_id]
+            if item.amount != submitted[ingredient_id]:
+                item.amount = submitted[ingredient_id]
+                changed.append(item)
+        if changed:
+            IngredientsRecipe.objects.bulk_update(changed, ('amount',))
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in current
+        ]
+        if added:
+            self.add_ingredients(ingredients=added, recipe=recipe)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if 'image' in validated_data:
+            validated_data['thumbnails'] = {}
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.add_ingredients(
-            recipe=instance,
-            ingredients=ingredients
-        )
-        instance.save()
+        if 'image' in validated_data and instance.image:
+            schedule_thumbnails(instance)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(
+                recipe=instance,
+                ingredients=ingredients
+            )
         return instance
 
     def to_representation(self, instance):
+        if hasattr(instance, '_prefetched_objects_cache'):
+            instance._prefetched_objects_cache.clear()
+        prefetch_related_objects([instance], *RECIPES_PREFETCH)
         return representation(self.context, instance, RecipesGetSerializer)
 
 
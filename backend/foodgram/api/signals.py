@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredients, IngredientsRecipe, Recipes, Tags
+from users.models import CustomUser
+
+from .cache import bump_table_version, invalidate_recipe_fragments
+from .matching import record_ingredients_change
+
+USER_SERIALIZED_FIELDS = {
+    'email',
+    'username',
+    'first_name',
+    'last_name',
+}
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+@receiver((post_save, post_delete), sender=Tags)
+def reference_changed(sender, **kwargs):
+    # Версия меняется только после коммита: иначе читатель успеет
+    # закешировать старые строки под новой версией.
+    transaction.on_commit(lambda: bump_table_version(sender))
+
+
+@receiver(post_save, sender=CustomUser)
+def user_changed(instance, created, update_fields=None, **kwargs):
+    # У нового пользователя ещё нет рецептов, а вход обновляет
+    # только last_login: кеш рецептов при этом сбрасывать не нужно.
+    # Рецепты удалённого пользователя удаляются каскадом и сами
+    # сбрасывают свои части.
+    if created:
+        return
+    if update_fields and not USER_SERIALIZED_FIELDS & set(update_fields):
+        return
+    invalidate_recipe_fragments(
+        Recipes.objects.filter(author=instance).values_list('id', flat=True)
+    )
+
+
+@receiver((post_save, post_delete), sender=Recipes)
+def recipe_changed(instance, **kwargs):
+    invalidate_recipe_fragments((instance.id,))
+
+
+@receiver((post_save, post_delete), sender=IngredientsRecipe)
+def recipe_ingredient_changed(instance, **kwargs):
+    invalidate_recipe_fragments((instance.recipe_id,))
+    record_ingredients_change((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipe_fragments((instance.id,))
+    elif pk_set is None:
+        transaction.on_commit(lambda: bump_table_version(Tags))
+    else:
+        invalidate_recipe_fragments(pk_set)
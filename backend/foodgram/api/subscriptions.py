@@ -0,0 +1,52 @@
+from users.models import Follow
+
+
+class SubscriptionResolver:
+    """
+    Подписки текущего пользователя в рамках одного запроса.
+    Сериализаторы заранее регистрируют id авторов, а при первом
+    обращении подписки на всех них загружаются одним запросом.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.pending = set()
+        self.known = {}
+
+    def add(self, author_ids):
+        self.pending.update(
+            author_id for author_id in author_ids
+            if author_id not in self.known
+        )
+
+    def is_subscribed(self, author_id):
+        if self.user is None or self.user.is_anonymous:
+            return False
+        if author_id not in self.known:
+            self.pending.add(author_id)
+            self._load()
+        return self.known[author_id]
+
+    def _load(self):
+        following = set(
+            Follow.objects
+            .filter(user=self.user, author_id__in=self.pending)
+            .values_list('author_id', flat=True)
+        )
+        self.known.update(
+            (author_id, author_id in following)
+            for author_id in self.pending
+        )
+        self.pending = set()
+
+
+def get_subscription_resolver(request):
+    """Резолвер, общий для всех сериализаторов одного запроса."""
+
+    if request is None:
+        return SubscriptionResolver(None)
+    resolver = getattr(request, '_subscription_resolver', None)
+    if resolver is None:
+        resolver = SubscriptionResolver(request.user)
+        request._subscription_resolver = resolver
+    return resolver
@@ -0,0 +1,247 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favourites,
+    Ingredients,
+    IngredientsRecipe,
+    Recipes,
+    ShoppingCart,
+    Tags
+)
+from users.models import CustomUser, Follow
+
+from .cache import recipe_fragment_key
+from .pagination import KeysetPagination
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'foodgram-tests',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheTestCase(TestCase):
+    """Тесты работают с пустым локальным кешем вместо общего."""
+
+    def setUp(self):
+        cache.clear()
+
+
+class RecipeListQueriesTest(CacheTestCase):
+    """Число запросов к базе на странице рецептов не зависит от её размера."""
+
+    RECIPES_COUNT = 12
+    # Страница с флагами пользователя, оценка числа рецептов
+    # (reltuples, EXPLAIN, COUNT) и по запросу на теги и ингредиенты.
+    PAGE_QUERIES = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            username='reader', email='reader@foodgram.ru'
+        )
+        authors = [
+            CustomUser.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru'
+            )
+            for number in range(3)
+        ]
+        Follow.objects.create(user=cls.user, author=authors[0])
+        tags = [
+            Tags.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredients.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(5)
+        ]
+        for number in range(cls.RECIPES_COUNT):
+            recipe = Recipes.objects.create(
+                author=authors[number % len(authors)],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='movies/recipe.png'
+            )
+            recipe.tags.set(tags)
+            IngredientsRecipe.objects.bulk_create(
+                IngredientsRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients[:3]
+            )
+            if number % 2:
+                Favourites.objects.create(user=cls.user, recipes=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipes=recipe)
+
+    def assert_page_queries(self, client, page_size, queries):
+        with mock.patch.object(KeysetPagination, 'page_size', page_size):
+            with self.assertNumQueries(queries):
+                response = client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return response
+
+    def test_anonymous(self):
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size):
+                cache.clear()
+                self.assert_page_queries(
+                    APIClient(), page_size, self.PAGE_QUERIES
+                )
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size):
+                cache.clear()
+                response = self.assert_page_queries(
+                    client, page_size, self.PAGE_QUERIES
+                )
+                for recipe in response.data['results']:
+                    favourited = Favourites.objects.filter(
+                        user=self.user, recipes_id=recipe['id']
+                    ).exists()
+                    self.assertEqual(recipe['is_favorited'], favourited)
+
+    def test_cached_fragments(self):
+        """Повторная страница собирается из кеша одним запросом."""
+
+        client = APIClient()
+        with mock.patch.object(KeysetPagination, 'page_size', 10):
+            client.get('/api/recipes/')
+        self.assert_page_queries(client, 10, 1)
+
+
+class ReferenceCacheTest(CacheTestCase):
+    """Справочник отдаётся из кеша до изменения таблицы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tags.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+    def test_cached_until_changed(self):
+        client = APIClient()
+        response = client.get('/api/tags/')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = client.get('/api/tags/')
+        self.assertEqual(response['ETag'], etag)
+        response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tags.objects.create(name='Обед', color='#49B64E', slug='lunch')
+            response = client.get('/api/tags/')
+            self.assertEqual(response['ETag'], etag)
+        response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+
+class RecipeFragmentCacheTest(CacheTestCase):
+    """Закешированная часть рецепта сбрасывается после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create(
+            username='author', email='author@foodgram.ru', first_name='Иван'
+        )
+        cls.recipe = Recipes.objects.create(
+            author=cls.author,
+            name='Борщ',
+            text='Описание',
+            cooking_time=60,
+            image='movies/recipe.png'
+        )
+
+    def get_recipe(self):
+        return APIClient().get(f'/api/recipes/{self.recipe.id}/').json()
+
+    def test_recipe_changed(self):
+        self.get_recipe()
+        self.assertIsNotNone(cache.get(recipe_fragment_key(self.recipe.id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertIsNone(cache.get(recipe_fragment_key(self.recipe.id)))
+
+    def test_author_changed(self):
+        self.assertEqual(self.get_recipe()['author']['first_name'], 'Иван')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Пётр'
+            self.author.save(update_fields=('first_name',))
+        self.assertEqual(self.get_recipe()['author']['first_name'], 'Пётр')
+
+    def test_login_keeps_fragment(self):
+        self.get_recipe()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=('last_login',))
+        self.assertIsNotNone(cache.get(recipe_fragment_key(self.recipe.id)))
+
+
+class SubscriptionsRecipesLimitTest(CacheTestCase):
+    """В подписках у каждого автора последние recipes_limit рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            username='reader', email='reader@foodgram.ru'
+        )
+        cls.authors = [
+            CustomUser.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru'
+            )
+            for number in range(2)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+            for number in range(4):
+                Recipes.objects.create(
+                    author=author,
+                    name=f'Рецепт {number}',
+                    text='Описание',
+                    cooking_time=10,
+                    image='movies/recipe.png'
+                )
+
+    def get_recipes(self, recipes_limit):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(
+            '/api/users/subscriptions/', {'recipes_limit': recipes_limit}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            author['id']: [recipe['id'] for recipe in author['recipes']]
+            for author in response.data['results']
+        }
+
+    def test_latest_recipes(self):
+        expected = {
+            author.id: list(
+                author.recipes.order_by('-pub_date', '-id')
+                .values_list('id', flat=True)[:2]
+            )
+            for author in self.authors
+        }
+        self.assertEqual(self.get_recipes(2), expected)
+
+    def test_zero_limit(self):
+        self.assertEqual(
+            self.get_recipes(0), {author.id: [] for author in self.authors}
+        )
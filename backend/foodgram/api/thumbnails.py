@@ -0,0 +1,146 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipes
+
+from .cache import recipe_fragment_key
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+RECIPE_THUMBNAIL_SIZES = ('card', 'detail')
+SHORT_THUMBNAIL_SIZES = ('short',)
+
+
+def thumbnail_name(size, extension):
+    # Итоговое имя выбирает хранилище по содержимому миниатюры.
+    return f'thumbnails/{size}.{extension}'
+
+
+def make_thumbnails(image_name):
+    """Создаёт миниатюры всех размеров и форматов, возвращает их имена."""
+
+    with default_storage.open(image_name) as file:
+        with Image.open(file) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    thumbnails = {}
+    for size, box in settings.THUMBNAIL_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(box, Image.LANCZOS)
+        thumbnails[size] = {}
+        for name, (image_format, extension) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            thumbnail.save(
+                buffer, image_format, quality=settings.THUMBNAIL_QUALITY
+            )
+            thumbnails[size][name] = default_storage.save(
+                thumbnail_name(size, extension),
+                ContentFile(buffer.getvalue())
+            )
+    return thumbnails
+
+
+def update_thumbnails(recipe_id, image_name):
+    thumbnails = make_thumbnails(image_name)
+    # Картинку могли заменить, пока строились миниатюры.
+    updated = Recipes.objects.filter(
+        pk=recipe_id, image=image_name
+    ).update(thumbnails=thumbnails)
+    if updated:
+        cache.delete(recipe_fragment_key(recipe_id))
+
+
+def _run(recipe_id, image_name):
+    # Поток пула держит соединение между задачами, поэтому
+    # устаревшие закрываются так же, как в начале и конце запроса.
+    close_old_connections()
+    try:
+        update_thumbnails(recipe_id, image_name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры %s', image_name)
+    finally:
+        close_old_connections()
+
+
+class ThumbnailPool:
+    """
+    Фоновый пул для миниатюр. Создаётся при первой задаче, уже
+    в процессе воркера; очередь задач при желании можно заменить
+    внешней, поменяв только submit.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.lock = Lock()
+
+    def submit(self, recipe_id, image_name):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=settings.THUMBNAIL_WORKERS,
+                    thread_name_prefix='thumbnails'
+                )
+        self.executor.submit(_run, recipe_id, image_name)
+
+
+thumbnail_pool = ThumbnailPool()
+
+
+def schedule_thumbnails(recipe):
+    """
+    Ставит создание миниатюр в фоновый пул после коммита.
+    Без воркеров (THUMBNAIL_WORKERS=0) миниатюры создаются сразу.
+    """
+
+    recipe_id, image_name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.THUMBNAIL_WORKERS:
+            thumbnail_pool.submit(recipe_id, image_name)
+        else:
+            update_thumbnails(recipe_id, image_name)
+
+    transaction.on_commit(submit)
+
+
+def thumbnail_urls(recipe, sizes):
+    """URL миниатюр; пока они не готовы, отдаётся оригинал."""
+
+    if not recipe.image:
+        return None
+    original = recipe.image.url
+    thumbnails = recipe.thumbnails or {}
+    return {
+        size: {
+            name: (
+                default_storage.url(thumbnails[size][name])
+                if name in thumbnails.get(size, {}) else original
+            )
+            for name in THUMBNAIL_FORMATS
+        }
+        for size in sizes
+    }
+
+
+def absolute_thumbnails(thumbnails, request):
+    if not thumbnails or request is None:
+        return thumbnails
+    return {
+        size: {
+            name: request.build_absolute_uri(url)
+            for name, url in urls.items()
+        }
+        for size, urls in thumbnails.items()
+    }
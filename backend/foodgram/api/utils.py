@@ -1,19 +1,191 @@
-from collections import Counter
+import csv
+from collections import namedtuple
+from io import BytesIO
 
-from recipes.models import IngredientsRecipe
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import OuterRef, Subquery, Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import IngredientsRecipe, Recipes
+from users.models import CustomUser
+
+from .feed import Unnest
+
+CHUNK_SIZE = 500
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+
+RECIPES_LIMIT_PARAM = 'recipes_limit'
+INGREDIENTS_PARAM = 'ingredients'
+
+ShoppingCartFormat = namedtuple(
+    'ShoppingCartFormat',
+    ('render', 'content_type', 'extension')
+)
 
 
 def get_shopping_cart(user):
-    ingredients = IngredientsRecipe.objects.filter(
-        recipe__shopping_cart__user=user.user
+    """Суммарное количество ингредиентов из корзины, посчитанное в БД."""
+
+    return (
+        IngredientsRecipe.objects
+        .filter(recipe__shopping_cart__user=user)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(amount=Sum('amount'))
+        .order_by('ingredient__name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def get_recipes_limit(request):
+    """Значение recipes_limit из запроса или None, если оно не передано."""
+
+    value = request.query_params.get(RECIPES_LIMIT_PARAM) if request else None
+    if value in (None, ''):
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise ValidationError({
+            RECIPES_LIMIT_PARAM: 'Ожидается неотрицательное целое число.'
+        })
+    return limit
+
+
+def get_ingredient_ids(request):
+    """id ингредиентов из запроса: ?ingredients=1,2 или ?ingredients=1&..."""
+
+    values = [
+        value
+        for param in request.query_params.getlist(INGREDIENTS_PARAM)
+        for value in param.split(',')
+        if value.strip()
+    ]
+    try:
+        ingredient_ids = {int(value) for value in values}
+    except ValueError:
+        raise ValidationError({
+            INGREDIENTS_PARAM: 'Ожидается список id ингредиентов.'
+        })
+    if not ingredient_ids:
+        raise ValidationError({
+            INGREDIENTS_PARAM: 'Укажите хотя бы один ингредиент.'
+        })
+    return ingredient_ids
+
+
+def limit_recipes_per_author(queryset, limit, author_ids):
+    """
+    Оставляет не больше limit последних рецептов каждого из авторов.
+    Для каждого автора LIMIT берётся по индексу (author, pub_date)
+    в массив, и массивы разворачиваются в список id: работа зависит
+    от числа авторов и limit, а не от числа рецептов у автора.
+    """
+
+    if limit is None:
+        return queryset
+    if not limit:
+        return queryset.none()
+    latest = ArraySubquery(
+        Recipes.objects
+        .filter(author_id=OuterRef('pk'))
+        .order_by('-pub_date', '-id')
+        .values('id')[:limit]
     )
-    compressed_ingredients = Counter()
-    for ing in ingredients:
-        compressed_ingredients[
-            (ing.ingredient.name, ing.ingredient.measurement_unit)
-        ] += ing.amount
-    return ([
-        f"- {name}: {amount} {measurement_unit}\n"
-        for (name, measurement_unit), amount
-        in compressed_ingredients.items()
-    ])
+    return queryset.filter(id__in=Subquery(
+        CustomUser.objects
+        .filter(id__in=author_ids)
+        .order_by()
+        .annotate(recipe_id=Unnest(latest))
+        .values('recipe_id')
+    ))
+
+
+def _chunks(lines):
+    """Склеивает строки в блоки по CHUNK_SIZE для StreamingHttpResponse."""
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _lines(ingredients):
+    for item in ingredients:
+        yield (
+            f"- {item['ingredient__name']}: {item['amount']} "
+            f"{item['ingredient__measurement_unit']}\n"
+        )
+
+
+def render_txt(ingredients):
+    return _chunks(_lines(ingredients))
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(ingredients):
+    writer = csv.writer(_Echo())
+    rows = (
+        writer.writerow((
+            item['ingredient__name'],
+            item['amount'],
+            item['ingredient__measurement_unit'],
+        ))
+        for item in ingredients
+    )
+    header = writer.writerow(('name', 'amount', 'measurement_unit'))
+    return _chunks(_prepend(header, rows))
+
+
+def render_pdf(ingredients):
+    # PDF нельзя отдавать построчно: документ собирается целиком,
+    # а затем отправляется блоками.
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT)
+        )
+    buffer = BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    y = height - PDF_MARGIN
+    page.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+    for line in _lines(ingredients):
+        if y < PDF_MARGIN:
+            page.showPage()
+            page.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        page.drawString(PDF_MARGIN, y, line.rstrip('\n'))
+        y -= PDF_FONT_SIZE * 1.5
+    page.save()
+    buffer.seek(0)
+    return iter(lambda: buffer.read(CHUNK_SIZE * 64), b'')
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': ShoppingCartFormat(render_txt, 'text/plain; charset=utf-8', 'txt'),
+    'csv': ShoppingCartFormat(render_csv, 'text/csv; charset=utf-8', 'csv'),
+    'pdf': ShoppingCartFormat(render_pdf, 'application/pdf', 'pdf'),
+}
@@ -1,15 +1,41 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import (
+    Exists,
+    OuterRef,
+    Prefetch,
+    Value,
+    prefetch_related_objects
+)
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
+from .autocomplete import ingredients_index
+from .feed import get_feed_page
+from .filters import (
+    RECIPE_ORDERINGS,
+    RECIPE_SEARCH_ORDERING,
+    IngredientFilter,
+    RecipeFilter
+)
+from .matching import recipe_ingredients_index
+from .mixins import ReferenceCacheMixin
+from .pagination import FeedPagination
 from .permissions import IsAuthorOrAdminOrReadOnlyPermission
-from recipes.models import Favourites, Ingredients, Recipes, ShoppingCart, Tags
+from recipes.models import (
+    Favourites,
+    Ingredients,
+    Recipes,
+    ShoppingCart,
+    Tags
+)
 from users.models import CustomUser, Follow
 from .serializers import (
     CustomUserSerializer,
@@ -21,7 +47,13 @@ from .serializers import (
     ShoppingListSerializer,
     TagsSerializer
 )
-from .utils import get_shopping_cart
+from .utils import (
+    SHOPPING_CART_FORMATS,
+    get_ingredient_ids,
+    get_recipes_limit,
+    get_shopping_cart,
+    limit_recipes_per_author
+)
 
 
 class CustomUserViewSet(UserViewSet):
@@ -30,14 +62,31 @@ class CustomUserViewSet(UserViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnlyPermission,)
+    cursor_ordering = ('id',)
 
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = CustomUser.objects.filter(following__user=request.user)
+        queryset = (
+            CustomUser.objects
+            .filter(following__user=request.user)
+            .annotate(is_subscribed=Value(True))
+        )
         pages = self.paginate_queryset(queryset)
+        # Рецепты выбираются только для авторов этой страницы.
+        recipes = limit_recipes_per_author(
+            Recipes.objects.only(
+                'id', 'name', 'image', 'thumbnails', 'cooking_time',
+                'author_id'
+            ).order_by('-pub_date', '-id'),
+            get_recipes_limit(request),
+            [author.id for author in pages]
+        )
+        prefetch_related_objects(
+            pages, Prefetch('recipes', queryset=recipes)
+        )
         serializer = FollowSerializer(
             pages,
             many=True,
@@ -78,7 +127,7 @@ class CustomUserViewSet(UserViewSet):
         )
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Работа с объектами Tag"""
 
     queryset = Tags.objects.all()
@@ -87,7 +136,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Работа с объектами Ingredients"""
 
     queryset = Ingredients.objects.all()
@@ -98,6 +147,27 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     permission_classes = (AllowAny,)
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.request.query_params.get('name'):
+            return queryset[:settings.INGREDIENTS_AUTOCOMPLETE_LIMIT]
+        return queryset
+
+    def get_list_response(self, request, *args, **kwargs):
+        # Префиксы и вхождения отдаются из индекса в памяти,
+        # в БД идём только за похожими названиями.
+        name = request.query_params.get('name')
+        if not name:
+            content = ingredients_index.all()
+        else:
+            content = ingredients_index.search(
+                name,
+                settings.INGREDIENTS_AUTOCOMPLETE_LIMIT
+            )
+        if content is None:
+            return super().get_list_response(request, *args, **kwargs)
+        return HttpResponse(content, content_type='application/json')
+
 
 class RecipesViewSet(viewsets.ModelViewSet):
     """Работа с объектами Recipes"""
@@ -106,12 +176,63 @@ class RecipesViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrAdminOrReadOnlyPermission,)
+    cursor_ordering = ('-pub_date', '-id')
+
+    def get_cursor_ordering(self):
+        if self.action == 'feed':
+            return self.cursor_ordering
+        params = self.request.query_params
+        if params.get('ordering') in RECIPE_ORDERINGS:
+            return RECIPE_ORDERINGS[params['ordering']]
+        if params.get('search', '').strip():
+            return RECIPE_SEARCH_ORDERING
+        return self.cursor_ordering
+
+    def get_queryset(self):
+        # Теги и ингредиенты догружаются сериализатором только для
+        # рецептов, которых нет в кеше.
+        queryset = Recipes.objects.select_related('author')
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed=Value(False),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favourites.objects.filter(user=user, recipes=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipes=OuterRef('pk'))
+            ),
+            is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('author'))
+            ),
+        )
+
+    def get_keyset_page(self, queryset, ordering, condition, limit):
+        if self.action == 'feed':
+            return get_feed_page(
+                self.request.user, queryset, ordering, condition, limit
+            )
+        return queryset.filter(condition).order_by(*ordering)[:limit]
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed', 'by_ingredients'):
             return RecipesGetSerializer
         return RecipesCreateSerializer
 
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        pages = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(pages, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @staticmethod
     def create_object(request, pk, serializers):
         data = {'user': request.user.id, 'recipes': pk}
@@ -144,6 +265,31 @@ class RecipesViewSet(viewsets.ModelViewSet):
             )
         return self.delete_object(request=recipe, pk=key, model=model)
 
+    @action(
+        detail=False,
+        url_path='by-ingredients',
+        pagination_class=PageNumberPagination
+    )
+    def by_ingredients(self, request):
+        # Пересечение считается по индексу в памяти, из БД
+        # загружаются только рецепты текущей страницы.
+        matches = self.paginate_queryset(
+            recipe_ingredients_index.match(get_ingredient_ids(request))
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        matches = [match for match in matches if match[0] in recipes]
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in matches],
+            many=True
+        )
+        data = serializer.data
+        for item, (_, matched, missing) in zip(data, matches):
+            item['ingredients_matched'] = matched
+            item['ingredients_missing'] = missing
+        return self.get_paginated_response(data)
+
     @action(
         detail=True,
         methods=('post', 'delete'),
@@ -176,9 +322,21 @@ class RecipesViewSet(viewsets.ModelViewSet):
         detail=False,
         permission_classes=(IsAuthenticated,),
     )
-    def download_shopping_cart(self, user):
-        shopping_cart = get_shopping_cart(user)
-        filename = 'shopping-list.txt'
-        response = HttpResponse(shopping_cart, content_type='text/plain')
+    def download_shopping_cart(self, request):
+        file_format = request.query_params.get('filetype', 'txt')
+        if file_format not in SHOPPING_CART_FORMATS:
+            raise ValidationError({
+                'filetype': (
+                    'Доступные форматы: '
+                    f'{", ".join(SHOPPING_CART_FORMATS)}.'
+                )
+            })
+        renderer = SHOPPING_CART_FORMATS[file_format]
+        shopping_cart = get_shopping_cart(request.user)
+        filename = f'shopping-list.{renderer.extension}'
+        response = StreamingHttpResponse(
+            renderer.render(shopping_cart),
+            content_type=renderer.content_type
+        )
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
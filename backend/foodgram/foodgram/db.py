@@ -0,0 +1,104 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Токен только что выдан на первичной базе, реплика может
+# его ещё не знать.
+PRIMARY_MODELS = {'authtoken.token'}
+
+REPLICAS = [
+    alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS
+]
+
+# Реплика, выбранная для текущего запроса, или None.
+read_replica = ContextVar('read_replica', default=None)
+
+
+def set_statement_timeout(connection, **kwargs):
+    # SET, а не параметр options при подключении: pgbouncer
+    # не принимает options и отклонил бы такое соединение.
+    if connection.vendor != 'postgresql' or not settings.DB_STATEMENT_TIMEOUT:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SET statement_timeout = %s', [settings.DB_STATEMENT_TIMEOUT]
+        )
+
+
+def enable_statement_timeout():
+    """
+    Ограничение времени запросов к базе для веб-процессов. Вызывается
+    из wsgi.py и asgi.py, поэтому миграции и команды manage.py
+    (пересчёты, построение индексов) работают без ограничения.
+    """
+
+    connection_created.connect(
+        set_statement_timeout, dispatch_uid='statement_timeout'
+    )
+
+
+def client_key(request):
+    """Ключ клиента: токен или сессия, без обращения к базе."""
+
+    identity = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not identity:
+        return None
+    digest = hashlib.sha256(identity.encode()).hexdigest()
+    return f'db-primary:{digest}'
+
+
+class ReplicaMiddleware:
+    """
+    Безопасные запросы читают из реплик, остальные работают
+    с первичной базой. После успешного изменяющего запроса клиент
+    DB_REPLICA_STICKY_SECONDS читает только из первичной базы
+    и видит свои изменения, даже если реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not REPLICAS:
+            return self.get_response(request)
+        key = client_key(request)
+        safe = request.method in SAFE_METHODS
+        # Реплика выбирается один раз, чтобы все запросы страницы
+        # видели одно и то же состояние данных.
+        replica = None
+        if safe and not (key and cache.get(key)):
+            replica = random.choice(REPLICAS)
+        token = read_replica.set(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_replica.reset(token)
+        if key and not safe and response.status_code < 400:
+            cache.set(key, True, settings.DB_REPLICA_STICKY_SECONDS)
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = read_replica.get()
+        if replica is None or model._meta.label_lower in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и первичная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,48 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    Файлы называются по sha256 содержимого: movies/ab/cd/<hash>.jpg.
+    Одинаковые загрузки хранятся один раз, а содержимое файла под
+    конкретным именем никогда не меняется, поэтому nginx может
+    отдавать его с Cache-Control: immutable.
+    Файлы, на которые больше нет ссылок, удаляет команда
+    delete_orphan_media.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        try:
+            # Такой файл уже есть. Свежий mtime защищает его от
+            # delete_orphan_media, пока рецепт с ним не сохранён.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
+
+    @staticmethod
+    def hashed_name(name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], f'{digest}{extension}'
+        )
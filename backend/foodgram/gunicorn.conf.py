@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+
+# Воркер держит в памяти весь Django, поэтому процессов немного,
+# а параллельность дают потоки: пока один поток ждёт ответа
+# Postgres, psycopg2 отпускает GIL и работают остальные.
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', min(multiprocessing.cpu_count() + 1, 4)
+))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Перезапуск воркеров ограничивает рост памяти от фрагментации.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+
+def on_starting(server):
+    # Локальный кеш у каждого процесса свой: версии таблиц, журнал
+    # изменений ингредиентов и отметки реплик расходятся между процессами.
+    cache_backend = os.getenv('CACHE_BACKEND', 'locmem')
+    if cache_backend == 'locmem' and workers > 1:
+        server.log.warning(
+            'CACHE_BACKEND=locmem with %s workers: each worker keeps '
+            'its own cache, set CACHE_BACKEND=redis', workers
+        )
@@ -30,9 +30,12 @@ class RecipesAdmin(admin.ModelAdmin):
         'tags__name',
     )
 
-    @display(description='Количество в избранных')
+    @display(
+        description='Количество в избранных',
+        ordering='favorites_count'
+    )
     def favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 class IngredientsAdmin(admin.ModelAdmin):
@@ -0,0 +1,26 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counter(queryset, field, delta):
+    """
+    Атомарно меняет счётчик через F(), без чтения строки. Разошедшийся
+    с данными счётчик не уходит ниже нуля и не нарушает CHECK поля.
+    """
+
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def count_subquery(model, field):
+    """Подзапрос с числом строк model, ссылающихся на внешнюю запись."""
+
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0)
+    )
@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from recipes.models import Recipes
+
+MEDIA_DIRECTORIES = ('movies', 'thumbnails')
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление картинок и миниатюр, на которые не ссылается '
+        'ни один рецепт'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=settings.MEDIA_ORPHAN_MIN_AGE_HOURS,
+            help=(
+                'Не трогать файлы моложе стольких часов: их могли '
+                'загрузить, но ещё не сохранить рецепт'
+            )
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены'
+        )
+
+    def handle(self, *args, **options):
+        referenced = self.referenced_names()
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+        deleted = size = 0
+        for name in self.stored_names():
+            if name in referenced or self.is_recent(name, cutoff):
+                continue
+            file_size = default_storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(name)
+            elif not self.delete_orphan(name, cutoff):
+                continue
+            size += file_size
+            deleted += 1
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {deleted}, {size / 1024 / 1024:.1f} МБ.'
+        ))
+
+    def delete_orphan(self, name, cutoff):
+        # Пока шёл обход, загрузка могла переиспользовать файл:
+        # хранилище обновляет его mtime, а ссылка появляется
+        # с сохранением рецепта.
+        if self.is_referenced(name) or self.is_recent(name, cutoff):
+            return False
+        default_storage.delete(name)
+        return True
+
+    @staticmethod
+    def is_recent(name, cutoff):
+        return default_storage.get_modified_time(name) > cutoff
+
+    @staticmethod
+    def is_referenced(name):
+        return Recipes.objects.annotate(
+            thumbnail_names=Cast('thumbnails', TextField())
+        ).filter(
+            Q(image=name) | Q(thumbnail_names__contains=f'"{name}"')
+        ).exists()
+
+    @staticmethod
+    def referenced_names():
+        recipes = Recipes.objects.values_list('image', 'thumbnails')
+        referenced = set()
+        for image, thumbnails in recipes.iterator():
+            if image:
+                referenced.add(image)
+            for formats in (thumbnails or {}).values():
+                referenced.update(formats.values())
+        return referenced
+
+    def stored_names(self):
+        for directory in MEDIA_DIRECTORIES:
+            if default_storage.exists(directory):
+                yield from self.walk(directory)
+
+    def walk(self, directory):
+        directories, files = default_storage.listdir(directory)
+        for name in files:
+            yield f'{directory}/{name}'
+        for name in directories:
+            yield from self.walk(f'{directory}/{name}')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.thumbnails import update_thumbnails
+from recipes.models import Recipes
+
+
+class Command(BaseCommand):
+    help = 'Создание миниатюр для картинок рецептов, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать миниатюры для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(thumbnails={})
+        created = failed = 0
+        for recipe_id, image_name in recipes.values_list('id', 'image'):
+            try:
+                update_thumbnails(recipe_id, image_name)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'{image_name}: {error}')
+                continue
+            created += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры созданы для {created} рецептов, ошибок: {failed}.'
+        ))
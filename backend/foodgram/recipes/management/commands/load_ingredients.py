@@ -1,30 +1,94 @@
+import json
 from csv import DictReader
+from itertools import islice
+from pathlib import Path
+from time import monotonic
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import bump_table_version
 from recipes.models import Ingredients
 
-ALREDY_LOADED_ERROR_MESSAGE = """
-If you need to reload child data from a CSV file,
-first delete the database file to destroy the database.
-Then run `python manage.py move" for a new empty
-database with tables"""
+DEFAULT_PATH = settings.BASE_DIR.parent.parent / 'data' / 'ingredients.csv'
+DEFAULT_BATCH_SIZE = 500
+
+
+def read_csv(file):
+    yield from DictReader(file)
+
+
+def read_json(file):
+    # Справочник небольшой, поэтому JSON-массив читается целиком,
+    # а в БД он всё равно уходит пачками.
+    yield from json.load(file)
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
 
 
 class Command(BaseCommand):
     help = 'Загрузка ингредиентов'
 
-    def handle(self, *args, **kwargs):
-        if Ingredients.objects.exists():
-            print('child data already loaded...exiting.')
-            print(ALREDY_LOADED_ERROR_MESSAGE)
-            return
-        print("Loading childrens data")
-
-        for row in DictReader(
-            open('../ingredients.csv', encoding="utf8")
-        ):
-            child = Ingredients(
-                name=row['name'],
-                measurement_unit=row['measurement_unit'],
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DEFAULT_PATH,
+            type=Path,
+            help='Путь к файлу ингредиентов (.csv или .json).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=DEFAULT_BATCH_SIZE,
+            type=int,
+            help='Количество строк в одном INSERT.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(
+                f'Неподдерживаемый формат файла: {path.suffix}'
             )
-            child.save()
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше 0.')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+
+        start = monotonic()
+        rows_count = 0
+        before = Ingredients.objects.count()
+        with open(path, encoding='utf8') as file, transaction.atomic():
+            for batch in batches(reader(file), batch_size):
+                Ingredients.objects.bulk_create(
+                    [
+                        Ingredients(
+                            name=row['name'].strip(),
+                            measurement_unit=row['measurement_unit'].strip(),
+                        )
+                        for row in batch
+                    ],
+                    ignore_conflicts=True,
+                )
+                rows_count += len(batch)
+        created = Ingredients.objects.count() - before
+        if created:
+            # bulk_create не отправляет post_save, меняем версию сами.
+            bump_table_version(Ingredients)
+        elapsed = monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {rows_count}, добавлено: {created}, '
+            f'{rows_count / elapsed if elapsed else rows_count:.0f} строк/с.'
+        ))
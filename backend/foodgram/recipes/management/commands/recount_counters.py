@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import count_subquery
+from recipes.models import Favourites, Recipes, ShoppingCart
+from users.models import CustomUser, Follow
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного, покупок, рецептов и подписчиков'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.update(
+            favorites_count=count_subquery(Favourites, 'recipes'),
+            shopping_cart_count=count_subquery(ShoppingCart, 'recipes'),
+        )
+        users = CustomUser.objects.update(
+            recipes_count=count_subquery(Recipes, 'author'),
+            followers_count=count_subquery(Follow, 'author'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}.'
+        ))
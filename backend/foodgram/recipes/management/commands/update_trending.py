@@ -0,0 +1,61 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.models import Favourites, Recipes, ShoppingCart
+
+WEIGHTS = {
+    Favourites: 1.0,
+    ShoppingCart: 0.5,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт рейтинга популярности рецептов: добавления в избранное '
+        'и в список покупок с затуханием по времени'
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+        half_life = settings.TRENDING_HALF_LIFE_HOURS
+        scores = defaultdict(float)
+        for model, weight in WEIGHTS.items():
+            buckets = (
+                model.objects
+                .filter(created__gte=since)
+                .annotate(hour=TruncHour('created'))
+                .values('recipes_id', 'hour')
+                .annotate(added=Count('id'))
+                .order_by()
+            )
+            for bucket in buckets:
+                age = (now - bucket['hour']).total_seconds() / 3600
+                scores[bucket['recipes_id']] += (
+                    weight * bucket['added'] * 0.5 ** (age / half_life)
+                )
+        # Трогаем только рецепты с активностью в окне
+        # и те, у которых рейтинг ещё не обнулён.
+        with transaction.atomic():
+            recipes = Recipes.objects.filter(
+                Q(id__in=list(scores)) | Q(trending_score__gt=0)
+            )
+            changed = []
+            for recipe in recipes.only('id', 'trending_score'):
+                score = round(scores.get(recipe.id, 0.0), 6)
+                if recipe.trending_score != score:
+                    recipe.trending_score = score
+                    changed.append(recipe)
+            Recipes.objects.bulk_update(
+                changed, ('trending_score',), batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлён рейтинг {len(changed)} рецептов.'
+        ))
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        # Таблица связи рецептов и тегов создаётся Django автоматически,
+        # поэтому индекс добавляется SQL-запросом.
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX recipes_tags_tag_recipe_idx '
+                'ON recipes_recipes_tags (tags_id, recipes_id);'
+            ),
+            reverse_sql='DROP INDEX recipes_tags_tag_recipe_idx;',
+        ),
+    ]
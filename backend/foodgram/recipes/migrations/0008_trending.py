@@ -0,0 +1,43 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:00
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipes_counters'),
+    ]
+
+    # Дата добавления старых строк неизвестна: они получают дату
+    # вне окна TRENDING_WINDOW_DAYS и учитываются только в popular,
+    # иначе первые дни после выката trending совпадал бы с popular.
+    operations = [
+        migrations.AddField(
+            model_name='favourites',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc), verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc), verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг популярности за последнее время'),
+        ),
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['-trending_score', '-pub_date', '-id'], name='recipe_trending_idx'),
+        ),
+    ]
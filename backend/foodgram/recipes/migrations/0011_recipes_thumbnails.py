@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipes_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='thumbnails',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Миниатюры'),
+        ),
+    ]
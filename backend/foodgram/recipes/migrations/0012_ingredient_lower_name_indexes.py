@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipes_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingredients',
+            name='ingredient_name_prefix_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='ingredients',
+            name='ingredient_name_trgm_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ingredients',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('name'), name='text_pattern_ops'), name='ingredient_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredients',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('name'), name='gin_trgm_ops'), name='ingredient_lower_name_trgm_idx'),
+        ),
+    ]
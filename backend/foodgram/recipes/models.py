@@ -1,7 +1,10 @@
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 from django.db.models import UniqueConstraint
+from django.db.models.functions import Lower
 from users.models import CustomUser
 
 
@@ -49,6 +52,23 @@ class Ingredients(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
+        # Поиск по названию без учёта регистра идёт по lower(name).
+        indexes = [
+            models.Index(
+                OpClass(Lower('name'), name='text_pattern_ops'),
+                name='ingredient_lower_name_idx',
+            ),
+            GinIndex(
+                OpClass(Lower('name'), name='gin_trgm_ops'),
+                name='ingredient_lower_name_trgm_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -80,6 +100,11 @@ class Recipes(models.Model):
         blank=True,
         help_text='Картинка'
     )
+    thumbnails = models.JSONField(
+        'Миниатюры',
+        default=dict,
+        editable=False
+    )
     name = models.CharField('Название', max_length=settings.MAX_LENGTH)
     text = models.TextField('Описание')
     cooking_time = models.PositiveBigIntegerField(
@@ -97,6 +122,26 @@ class Recipes(models.Model):
         'Дата создания',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'Количество в избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'Количество в списках покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    trending_score = models.FloatField(
+        'Рейтинг популярности за последнее время',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
@@ -108,6 +153,28 @@ class Recipes(models.Model):
                 name='unique_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx',
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=['-trending_score', '-pub_date', '-id'],
+                name='recipe_trending_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name[:settings.LEN_NAME_IN_STR]
@@ -167,6 +234,11 @@ class Favourites(models.Model):
         verbose_name='Избраный рецепт',
         related_name='favorites',
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -197,6 +269,11 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт',
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Корзина покупок'
@@ -0,0 +1,36 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db.models import OuterRef, Subquery
+
+SEARCH_CONFIG = 'russian'
+SEARCH_FIELDS = {'name', 'text'}
+
+
+def ingredient_names(ingredients_model):
+    """Подзапрос с названиями ингредиентов рецепта через пробел."""
+
+    return Subquery(
+        ingredients_model.objects.filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+
+
+def search_vector(ingredients_model):
+    """Название весит больше ингредиентов, ингредиенты больше описания."""
+
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            ingredient_names(ingredients_model),
+            weight='B',
+            config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(queryset, ingredients_model):
+    queryset.update(search_vector=search_vector(ingredients_model))
@@ -0,0 +1,136 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import CustomUser
+from .counters import change_counter
+from .models import (
+    Favourites,
+    Ingredients,
+    IngredientsRecipe,
+    Recipes,
+    ShoppingCart
+)
+from .search import SEARCH_FIELDS, update_search_vector
+
+COUNTERS = {
+    Favourites: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+
+
+@receiver(post_save, sender=Favourites)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipes.objects.filter(pk=instance.recipes_id),
+            COUNTERS[sender],
+            1
+        )
+
+
+@receiver(post_delete, sender=Favourites)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_removed(sender, instance, **kwargs):
+    change_counter(
+        Recipes.objects.filter(pk=instance.recipes_id),
+        COUNTERS[sender],
+        -1
+    )
+
+
+@receiver(post_save, sender=Recipes)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(
+            CustomUser.objects.filter(pk=instance.author_id),
+            'recipes_count',
+            1
+        )
+
+
+@receiver(post_delete, sender=Recipes)
+def recipe_deleted(instance, **kwargs):
+    change_counter(
+        CustomUser.objects.filter(pk=instance.author_id),
+        'recipes_count',
+        -1
+    )
+
+
+class SearchUpdates:
+    """
+    Рецепты, чей вектор поиска пересчитывается после коммита, когда
+    ингредиенты уже сохранены. id копятся за всю транзакцию,
+    пересчёт — один UPDATE; удалённые рецепты пропускаются.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.ids = set()
+        self.deleted = set()
+
+    @property
+    def scheduled(self):
+        # После отката транзакции Django выбрасывает её колбэки,
+        # и накопленные id начинают собираться заново.
+        return any(
+            entry[1] == self.run for entry in self.connection.run_on_commit
+        )
+
+    def run(self):
+        self.connection.search_updates = None
+        ids = self.ids - self.deleted
+        if ids:
+            update_search_vector(
+                Recipes.objects.filter(pk__in=ids), IngredientsRecipe
+            )
+
+
+def pending_search_updates():
+    connection = transaction.get_connection()
+    updates = getattr(connection, 'search_updates', None)
+    if updates is not None and updates.scheduled:
+        return updates
+    return None
+
+
+def schedule_search_update(recipe_ids):
+    updates = pending_search_updates()
+    if updates is not None:
+        updates.ids.update(recipe_ids)
+        return
+    connection = transaction.get_connection()
+    updates = SearchUpdates(connection)
+    updates.ids.update(recipe_ids)
+    connection.search_updates = updates
+    transaction.on_commit(updates.run)
+
+
+@receiver(post_save, sender=Recipes)
+def recipe_saved(instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_FIELDS & set(update_fields):
+        return
+    schedule_search_update((instance.pk,))
+
+
+@receiver(post_delete, sender=Recipes)
+def recipe_search_deleted(instance, **kwargs):
+    updates = pending_search_updates()
+    if updates is not None:
+        updates.deleted.add(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=IngredientsRecipe)
+def recipe_ingredient_changed(instance, **kwargs):
+    schedule_search_update((instance.recipe_id,))
+
+
+@receiver(post_save, sender=Ingredients)
+def ingredient_renamed(instance, created, **kwargs):
+    if not created:
+        schedule_search_update(
+            IngredientsRecipe.objects.filter(ingredient=instance)
+            .values_list('recipe_id', flat=True)
+        )
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.counters import change_counter
+from .models import CustomUser, Follow
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        change_counter(
+            CustomUser.objects.filter(pk=instance.author_id),
+            'followers_count',
+            1
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    change_counter(
+        CustomUser.objects.filter(pk=instance.author_id),
+        'followers_count',
+        -1
+    )